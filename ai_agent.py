@@ -1,6 +1,66 @@
-from groq import Groq
-from typing import List, Dict
+from groq import AsyncGroq
+from typing import AsyncIterator, List, Dict, Tuple
+from collections import OrderedDict
+import asyncio
+import hashlib
 import random
+import re
+import httpx
+from patterns import URL_RE
+
+_DIGITS_RE = re.compile(r'\d+')
+_SPACE_RE = re.compile(r'\s+')
+
+# Invariant instructions kept byte-identical across calls so the provider can
+# cache the prompt prefix. Anything per-session or per-turn goes after it.
+_STATIC_SYSTEM_PROMPT = """You are pretending to be a victim of a scam. Your goal is to extract information from the scammer while appearing believable.
+
+RULES:
+1. NEVER reveal you know it's a scam
+2. Ask questions that might make the scammer reveal:
+   - Phone numbers
+   - UPI IDs or payment details
+   - Website links
+   - Company/organization names
+   - Bank account details
+3. Keep responses short (1-3 sentences)
+4. Show appropriate emotion (worry, confusion, eagerness)
+5. Sometimes make spelling/grammar mistakes to seem more human
+6. Ask for verification but be willing to proceed
+
+You will be given your persona and the scam type, then the conversation so far. Scammer messages are user turns and your earlier replies are assistant turns. Your current goal is given just before the latest scammer message.
+Respond as your persona would, naturally continuing the conversation."""
+
+_STATIC_MESSAGE = {"role": "system", "content": _STATIC_SYSTEM_PROMPT}
+
+_CONTEXT_TEMPLATE = """{persona_block}
+
+SCAM TYPE: {scam_type}"""
+
+_GOAL_TEMPLATE = "CURRENT GOAL: {goal}"
+
+_SUMMARY_PROMPT = "Summarize this conversation between a scammer (user) and a victim (assistant) in a few sentences. Keep every phone number, UPI ID, link, account number and organization name mentioned."
+
+# Once a session's history grows past _COMPACT_AT messages, the oldest
+# _COMPACT_COUNT are folded into one summary message. The prefix then stays
+# stable again for the next stretch of turns.
+_COMPACT_AT = 30
+_COMPACT_COUNT = 20
+
+_FALLBACKS = (
+    "I am worried. Can you please explain more?",
+    "What should I do? I don't want my account blocked!",
+    "Can you give me your phone number? I want to call and verify.",
+    "Is there a website I can check? My son told me to always verify.",
+)
+
+# (message_count upper bound, goal) for each conversation stage
+_GOAL_TABLE = (
+    (5, "Express concern and ask clarifying questions to understand the situation better"),
+    (12, "Show willingness to comply but ask for verification details (phone number, website, company name, etc.)"),
+    (20, "Claim technical difficulties or ask for alternative methods. Extract payment details if offered."),
+    (10**9, "Start showing slight suspicion or say you need to consult someone, but still extract any final details"),
+)
 
 class AIAgent:
     """AI Agent with personas for engaging scammers"""
@@ -24,104 +84,217 @@ class AIAgent:
         }
     }
     
-    def __init__(self, api_key: str, model: str = "mixtral-8x7b-32768"):
-        self.client = Groq(api_key=api_key)
+    _ALL_PERSONAS = tuple(PERSONAS)
+    _KYC_PERSONAS = ('elderly', 'skeptical')
+    
+    # One fixed block per persona, so the second prompt segment is also stable
+    _PERSONA_BLOCKS = {
+        name: f"PERSONA: {name} ({p['style']})\nEXAMPLE RESPONSE: {p['sample']}"
+        for name, p in PERSONAS.items()
+    }
+    
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "mixtral-8x7b-32768",
+        cache_size: int = 2048,
+        max_concurrency: int = 16
+    ):
+        # One pooled HTTP/2 client so completions reuse warm TLS connections
+        self._http = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            timeout=httpx.Timeout(30.0, connect=5.0),
+        )
+        self.client = AsyncGroq(api_key=api_key, http_client=self._http)
+        # Caps in-flight completions; extra calls wait here instead of
+        # piling onto Groq and tripping its rate limits
+        self._inflight = asyncio.Semaphore(max_concurrency)
         self.model = model
-        self.current_persona = None
+        self.cache_size = cache_size
+        self._reply_cache: "OrderedDict[Tuple, str]" = OrderedDict()
+        # (persona, scam_type) -> prebuilt context message; both sets are small
+        self._context_messages: Dict[Tuple[str, str], Dict] = {}
+    
+    async def aclose(self) -> None:
+        """Close the pooled HTTP client"""
+        await self._http.aclose()
+    
+    @staticmethod
+    def _normalize(message: str) -> str:
+        """Reduce a message to its template: no URLs, digits or extra whitespace"""
+        text = URL_RE.sub(' ', message.lower())
+        text = _DIGITS_RE.sub(' ', text)
+        return _SPACE_RE.sub(' ', text).strip()
+    
+    def _cache_key(self, persona_name: str, scam_type: str, message_count: int, message: str) -> Tuple:
+        digest = hashlib.blake2b(self._normalize(message).encode(), digest_size=16).digest()
+        return (persona_name, scam_type, message_count // 5, digest)
+    
+    def _first_contact_key(self, persona_name: str, messages: List[Dict], scam_info: Dict, message_count: int):
+        """Cache key for an opening message, or None once the session has history"""
+        if len(messages) != 1:
+            return None
+        return self._cache_key(persona_name, scam_info.get('scam_type', 'Unknown'), message_count, messages[0]['content'])
+    
+    def select_persona(self, scam_type: str, session_id: str) -> str:
+        """Select persona based on scam type, stable for a given session"""
+        if 'Prize' in scam_type or 'Lottery' in scam_type:
+            return 'eager'
+        
+        # Seeded by session so every worker picks the same persona for it
+        rng = random.Random(session_id)
+        if 'KYC' in scam_type or 'Bank' in scam_type:
+            return rng.choice(self._KYC_PERSONAS)
+        return rng.choice(self._ALL_PERSONAS)
+    
+    @staticmethod
+    def clean_reply(reply: str) -> str:
+        """Remove any meta-commentary from a model reply"""
+        return reply.replace("As the victim,", "").replace("*", "").strip()
+    
+    def _remember(self, cache_key: Tuple, reply: str) -> None:
+        # The key ignores digits and links, so a reply quoting either belongs
+        # to this scammer only
+        if _DIGITS_RE.search(reply) or URL_RE.search(reply):
+            return
+        self._reply_cache[cache_key] = reply
+        if len(self._reply_cache) > self.cache_size:
+            self._reply_cache.popitem(last=False)
+    
+    def _build_messages(self, persona_name: str, messages: List[Dict], scam_info: Dict, message_count: int) -> List[Dict]:
+        """Assemble the chat messages: static prefix, session history, goal"""
+        # Pick goal based on conversation stage
+        goal = next(g for limit, g in _GOAL_TABLE if message_count < limit)
+        
+        scam_type = scam_info.get('scam_type', 'Unknown')
+        context = self._context_messages.get((persona_name, scam_type))
+        if context is None:
+            context = {"role": "system", "content": _CONTEXT_TEMPLATE.format_map({
+                'persona_block': self._PERSONA_BLOCKS[persona_name],
+                'scam_type': scam_type,
+            })}
+            self._context_messages[(persona_name, scam_type)] = context
+        
+        return [
+            _STATIC_MESSAGE,
+            context,
+            *messages[:-1],
+            {"role": "system", "content": _GOAL_TEMPLATE.format_map({'goal': goal})},
+            messages[-1],
+        ]
     
-    def select_persona(self, scam_type: str) -> str:
-        """Select appropriate persona based on scam type"""
-        if not self.current_persona:
-            # Select persona based on scam type or randomly
-            if 'KYC' in scam_type or 'Bank' in scam_type:
-                self.current_persona = random.choice(['elderly', 'skeptical'])
-            elif 'Prize' in scam_type or 'Lottery' in scam_type:
-                self.current_persona = 'eager'
-            else:
-                self.current_persona = random.choice(list(self.PERSONAS.keys()))
+    async def _compact_history(self, messages: List[Dict]) -> None:
+        """Fold the oldest turns into a summary, in place, once history is long"""
+        if len(messages) <= _COMPACT_AT:
+            return
+        
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages[:_COMPACT_COUNT])
+        try:
+            async with self._inflight:
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": _SUMMARY_PROMPT},
+                        {"role": "user", "content": transcript},
+                    ],
+                    temperature=0.2,
+                    max_tokens=200,
+                )
+        except Exception as e:
+            # Keep the full history; we will try again next turn
+            print(f"History compaction failed: {e}")
+            return
         
-        return self.current_persona
+        summary = response.choices[0].message.content.strip()
+        messages[:_COMPACT_COUNT] = [{"role": "system", "content": f"EARLIER CONVERSATION (summary): {summary}"}]
     
-    def generate_response(
+    async def generate_response(
         self,
-        scam_message: str,
-        conversation_history: List[Dict],
+        session_id: str,
+        messages: List[Dict],
         scam_info: Dict,
         message_count: int
     ) -> str:
-        """Generate human-like response to engage scammer"""
+        """
+        Generate human-like response to engage scammer
+        `messages` is the session's role/content history ending with the
+        latest scammer message; it may be compacted in place.
+        """
+        persona_name = self.select_persona(scam_info.get('scam_type', 'Generic'), session_id)
         
-        persona_name = self.select_persona(scam_info.get('scam_type', 'Generic'))
-        persona = self.PERSONAS[persona_name]
+        # Scammers open with the same scripts, so identical first-contact
+        # lines can share a reply. Later turns depend on the session's own
+        # history and are never cached.
+        cache_key = self._first_contact_key(persona_name, messages, scam_info, message_count)
+        if cache_key is not None:
+            cached = self._reply_cache.get(cache_key)
+            if cached is not None:
+                self._reply_cache.move_to_end(cache_key)
+                return cached
         
-        # Build conversation context
-        history_text = ""
-        for msg in conversation_history[-6:]:  # Last 6 messages for context
-            role = "Scammer" if msg['sender'] == 'scammer' else "You"
-            history_text += f"{role}: {msg['text']}\n"
-        
-        # Create dynamic prompt based on conversation stage
-        if message_count < 5:
-            goal = "Express concern and ask clarifying questions to understand the situation better"
-        elif message_count < 12:
-            goal = "Show willingness to comply but ask for verification details (phone number, website, company name, etc.)"
-        elif message_count < 20:
-            goal = "Claim technical difficulties or ask for alternative methods. Extract payment details if offered."
-        else:
-            goal = "Start showing slight suspicion or say you need to consult someone, but still extract any final details"
-        
-        system_prompt = f"""You are pretending to be a {persona_name} victim of a scam. Your goal is to extract information from the scammer while appearing believable.
-
-PERSONA: {persona['style']}
-EXAMPLE RESPONSE: {persona['sample']}
-
-SCAM TYPE: {scam_info.get('scam_type', 'Unknown')}
-CURRENT GOAL: {goal}
-
-RULES:
-1. NEVER reveal you know it's a scam
-2. Ask questions that might make the scammer reveal:
-   - Phone numbers
-   - UPI IDs or payment details
-   - Website links
-   - Company/organization names
-   - Bank account details
-3. Keep responses short (1-3 sentences)
-4. Show appropriate emotion (worry, confusion, eagerness)
-5. Sometimes make spelling/grammar mistakes to seem more human
-6. Ask for verification but be willing to proceed
-
-PREVIOUS CONVERSATION:
-{history_text}
-
-LATEST SCAMMER MESSAGE: {scam_message}
-
-Respond as this persona would, naturally continuing the conversation:"""
+        await self._compact_history(messages)
+        prompt = self._build_messages(persona_name, messages, scam_info, message_count)
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": scam_message}
-                ],
-                temperature=0.8,  # More creative/varied
-                max_tokens=150,
-            )
-            
-            reply = response.choices[0].message.content.strip()
-            
-            # Remove any meta-commentary
-            reply = reply.replace("As the victim,", "").replace("*", "").strip()
+            async with self._inflight:
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=prompt,
+                    temperature=0.8,  # More creative/varied
+                    max_tokens=150,
+                )
             
+            reply = self.clean_reply(response.choices[0].message.content)
+            if cache_key is not None:
+                self._remember(cache_key, reply)
             return reply
             
         except Exception as e:
-            # Fallback responses
-            fallbacks = [
-                "I am worried. Can you please explain more?",
-                "What should I do? I don't want my account blocked!",
-                "Can you give me your phone number? I want to call and verify.",
-                "Is there a website I can check? My son told me to always verify.",
-            ]
-            return random.choice(fallbacks)
\ No newline at end of file
+            return random.choice(_FALLBACKS)
+    
+    async def stream_response(
+        self,
+        session_id: str,
+        messages: List[Dict],
+        scam_info: Dict,
+        message_count: int
+    ) -> AsyncIterator[str]:
+        """Same as generate_response, but yields the reply as Groq streams it"""
+        persona_name = self.select_persona(scam_info.get('scam_type', 'Generic'), session_id)
+        
+        cache_key = self._first_contact_key(persona_name, messages, scam_info, message_count)
+        if cache_key is not None:
+            cached = self._reply_cache.get(cache_key)
+            if cached is not None:
+                self._reply_cache.move_to_end(cache_key)
+                yield cached
+                return
+        
+        await self._compact_history(messages)
+        prompt = self._build_messages(persona_name, messages, scam_info, message_count)
+        
+        parts = []
+        try:
+            async with self._inflight:
+                stream = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=prompt,
+                    temperature=0.8,  # More creative/varied
+                    max_tokens=150,
+                    stream=True,
+                )
+                async for chunk in stream:
+                    piece = (chunk.choices[0].delta.content or "").replace("*", "")
+                    if piece:
+                        parts.append(piece)
+                        yield piece
+        except Exception as e:
+            print(f"Streaming response failed: {e}")
+            # Only fall back if nothing reached the client yet
+            if not parts:
+                yield random.choice(_FALLBACKS)
+            return
+        
+        if cache_key is not None:
+            self._remember(cache_key, self.clean_reply("".join(parts)))
\ No newline at end of file
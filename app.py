@@ -1,25 +1,93 @@
-from fastapi import FastAPI, Request, HTTPException, Header
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi import FastAPI, Request, HTTPException, Header, BackgroundTasks, Depends
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, field_validator
+from starlette.background import BackgroundTask
+from starlette.datastructures import Headers
+from contextlib import asynccontextmanager
 from typing import List, Dict, Optional
 import uvicorn
-from datetime import datetime
+import orjson
+import asyncio
+import time
 from fastapi.middleware.cors import CORSMiddleware
-import json
 
-from config import Config
+from config import CONFIG
 from scam_detector import ScamDetector
 from ai_agent import AIAgent
-from session_manager import SessionManager
+from session_manager import Session, SessionManager
 from voice_detector import VoiceDetector
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the session sweeper and callback worker; close clients on shutdown"""
+    sweeper = asyncio.create_task(session_manager.run_sweeper(CONFIG.SESSION_SWEEP_INTERVAL))
+    callback_worker = asyncio.create_task(session_manager.run_callback_worker())
+    yield
+    sweeper.cancel()
+    callback_worker.cancel()
+    await agent.aclose()
+    await session_manager.close()
+
 # Initialize FastAPI
 app = FastAPI(
     title="Impact AI Hackathon API",
     description="Solution for Scam Detection and AI Voice Detection",
-    version="2.1"
+    version="2.1",
+    lifespan=lifespan
 )
 
+class BodySizeLimitMiddleware:
+    """Reject oversized honeypot bodies before they are parsed or validated
+    
+    A declared Content-Length is checked up front; the bytes actually
+    received are counted too, so chunked uploads hit the same cap.
+    """
+    
+    PATHS = ("/", "/honeypot", "/honeypot/stream")
+    
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.PATHS:
+            await self.app(scope, receive, send)
+            return
+        
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length is not None:
+            if not content_length.isdigit():
+                await self._error(400, "Invalid Content-Length")(scope, receive, send)
+                return
+            if int(content_length) > self.max_bytes:
+                await self._error(413, "Request body too large")(scope, receive, send)
+                return
+        
+        received = 0
+        
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised while the route reads its body, so the
+                    # HTTPException handler turns it into the usual error
+                    raise HTTPException(status_code=413, detail="Request body too large")
+            return message
+        
+        await self.app(scope, receive_limited, send)
+    
+    @staticmethod
+    def _error(status_code: int, message: str) -> JSONResponse:
+        return JSONResponse(
+            status_code=status_code,
+            content={"status": "error", "message": message}
+        )
+
+app.add_middleware(BodySizeLimitMiddleware, max_bytes=CONFIG.MAX_BODY_BYTES)
+
 # Add CORS Middleware
 app.add_middleware(
     CORSMiddleware,
@@ -32,15 +100,35 @@ app.add_middleware(
 # --- MODELS ---
 
 class Message(BaseModel):
+    model_config = ConfigDict(
+        extra='ignore',
+        validate_assignment=False,
+        str_max_length=CONFIG.MAX_MESSAGE_LENGTH
+    )
+    
     sender: str
     text: str
     timestamp: int
 
 class HoneypotRequest(BaseModel):
+    model_config = ConfigDict(
+        extra='ignore',
+        validate_assignment=False,
+        str_max_length=CONFIG.MAX_MESSAGE_LENGTH
+    )
+    
     sessionId: str
     message: Message
-    conversationHistory: List[Dict] = []
+    conversationHistory: List[Message] = []
     metadata: Optional[Dict] = None
+    
+    @field_validator('conversationHistory', mode='before')
+    @classmethod
+    def cap_history(cls, v):
+        """Keep only the most recent turns, before they get validated"""
+        if isinstance(v, list) and len(v) > CONFIG.MAX_HISTORY_MESSAGES:
+            return v[-CONFIG.MAX_HISTORY_MESSAGES:]
+        return v
 
 class HoneypotResponse(BaseModel):
     status: str
@@ -68,6 +156,24 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         content={"status": "error", "message": str(exc.detail)}
     )
 
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    """Malformed request bodies use the same error format"""
+    # Unparseable JSON fails before verify_api_key runs; every route with a
+    # body needs the key, so a bad key still wins over a bad body
+    if request.headers.get("x-api-key") != CONFIG.API_KEY:
+        return JSONResponse(
+            status_code=401,
+            content={"status": "error", "message": "Invalid API key or malformed request"}
+        )
+    return JSONResponse(
+        status_code=422,
+        # Location and reason only; the submitted input is not echoed back
+        content={"status": "error", "message": str([
+            {"loc": e["loc"], "type": e["type"], "msg": e["msg"]} for e in exc.errors()
+        ])}
+    )
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """Catch-all for internal server errors"""
@@ -78,14 +184,25 @@ async def global_exception_handler(request: Request, exc: Exception):
 
 # --- COMPONENTS ---
 
-detector = ScamDetector()
-agent = AIAgent(api_key=Config.GROQ_API_KEY, model=Config.AI_MODEL)
-session_manager = SessionManager(guvi_callback_url=Config.GUVI_CALLBACK_URL)
+detector = ScamDetector(threshold=CONFIG.SCAM_THRESHOLD)
+agent = AIAgent(
+    api_key=CONFIG.GROQ_API_KEY,
+    model=CONFIG.AI_MODEL,
+    cache_size=CONFIG.RESPONSE_CACHE_SIZE,
+    max_concurrency=CONFIG.MAX_CONCURRENT_COMPLETIONS
+)
+session_manager = SessionManager(
+    guvi_callback_url=CONFIG.GUVI_CALLBACK_URL,
+    redis_url=CONFIG.REDIS_URL,
+    session_ttl=CONFIG.SESSION_TTL,
+    max_sessions=CONFIG.MAX_SESSIONS,
+    max_messages=CONFIG.MAX_MESSAGES
+)
 voice_detector = VoiceDetector()
 
-def verify_api_key(x_api_key: Optional[str]):
-    """Strict API key verification"""
-    if not x_api_key or x_api_key != Config.API_KEY:
+def verify_api_key(x_api_key: Optional[str] = Header(None, alias="x-api-key")):
+    """Strict API key verification, resolved before the body is validated"""
+    if not x_api_key or x_api_key != CONFIG.API_KEY:
         raise HTTPException(
             status_code=401,
             detail="Invalid API key or malformed request"
@@ -93,64 +210,83 @@ def verify_api_key(x_api_key: Optional[str]):
 
 # --- PROBLEM 2: AGENTIC HONEYPOT ENDPOINTS ---
 
-async def handle_honeypot_logic(request: Request, x_api_key: Optional[str]):
-    """Core logic for honeypot processing"""
-    # Verify API Key
-    verify_api_key(x_api_key)
+NEUTRAL_REPLY = "I'm not sure I understand. Can you explain more?"
+
+async def ingest_message(
+    payload: HoneypotRequest,
+    conversation_history: List[Dict],
+    background_tasks: BackgroundTasks
+) -> Session:
+    """Record the incoming message, run detection and queue extraction"""
+    session_id = payload.sessionId
+    incoming_message = payload.message.text
+    
+    # Session state management
+    session = await session_manager.load_session(session_id)
+    session_manager.seed_history(session_id, conversation_history)
+    record = session_manager.add_message(
+        session_id, 
+        payload.message.sender, 
+        incoming_message, 
+        payload.message.timestamp
+    )
+    message_lower = record['text_lower']
+    
+    # Scam detection
+    if not session.scam_detected:
+        detection_result = detector.detect(incoming_message, conversation_history, message_lower)
+        if detection_result['is_scam']:
+            session_manager.mark_scam(session_id, detection_result)
+    
+    # Intelligence extraction only feeds the callback, so it runs after the
+    # reply is sent; queued first, it always finishes before the callback
+    background_tasks.add_task(session_manager.extract, session_id, incoming_message, message_lower)
+    
+    return session
+
+async def record_reply(session: Session, reply: str, background_tasks: BackgroundTasks) -> None:
+    """Record our reply, persist the session and schedule the callback when due"""
+    session_id = session.session_id
+    session_manager.add_message(
+        session_id,
+        "user",
+        reply,
+        int(time.time() * 1000)  # Epoch ms, like the client's timestamps
+    )
+    
+    await session_manager.save_session(session_id)
     
+    # Mandatory Callback Check
+    # Trigger callback if scam is detected and we have engaged enough.
+    # It runs after the reply is sent, so a slow GUVI never delays the scammer.
+    # send_final_callback skips sessions whose callback is already queued.
+    if (session.scam_detected and not session.callback_sent
+            and session.message_count >= CONFIG.MIN_MESSAGES_FOR_INTEL):
+        background_tasks.add_task(session_manager.send_final_callback, session_id, 0)
+    
+    # Persist extracted intelligence and callback_sent for other workers
+    background_tasks.add_task(session_manager.save_session, session_id)
+
+async def handle_honeypot_logic(payload: HoneypotRequest, background_tasks: BackgroundTasks):
+    """Core logic for honeypot processing"""
     try:
-        # Load JSON body
-        body = await request.json()
-        payload = HoneypotRequest(**body)
-        
-        session_id = payload.sessionId
-        incoming_message = payload.message.text
-        conversation_history = payload.conversationHistory
-        
-        # Session state management
-        session = session_manager.get_or_create_session(session_id)
-        session_manager.add_message(
-            session_id, 
-            payload.message.sender, 
-            incoming_message, 
-            str(payload.message.timestamp)
-        )
-        
-        # Scam detection
-        if not session['scam_detected']:
-            detection_result = detector.detect(incoming_message, conversation_history)
-            if detection_result['is_scam']:
-                session['scam_detected'] = True
-                session['scam_info'] = detection_result
-        
-        # Intelligence extraction
-        session['intelligence'].extract(incoming_message)
+        conversation_history = [m.model_dump() for m in payload.conversationHistory]
+        session = await ingest_message(payload, conversation_history, background_tasks)
         
         # Response generation
-        if session['scam_detected']:
-            reply = agent.generate_response(
-                scam_message=incoming_message,
-                conversation_history=conversation_history,
-                scam_info=session['scam_info'],
-                message_count=session['message_count']
+        if session.scam_detected:
+            reply = await agent.generate_response(
+                session_id=session.session_id,
+                messages=session.messages,
+                scam_info=session.scam_info,
+                message_count=session.message_count
             )
         else:
             # Humanitarian/curious response or neutral fallback
-            reply = "I'm not sure I understand. Can you explain more?"
+            reply = NEUTRAL_REPLY
         
-        # Record response
-        session_manager.add_message(
-            session_id,
-            "user",
-            reply,
-            datetime.utcnow().isoformat() + "Z"
-        )
+        await record_reply(session, reply, background_tasks)
         
-        # Mandatory Callback Check
-        # Trigger callback if scam is detected and we have engaged enough
-        if session['scam_detected'] and session['message_count'] >= Config.MIN_MESSAGES_FOR_INTEL:
-            session_manager.send_final_callback(session_id, min_messages=0) # Logic handled here
-            
         return HoneypotResponse(status="success", reply=reply)
         
     except Exception as e:
@@ -158,10 +294,48 @@ async def handle_honeypot_logic(request: Request, x_api_key: Optional[str]):
         raise HTTPException(status_code=500, detail=str(e))
 
 # Explicitly handle POST and GET on both root and /honeypot to avoid 405
-@app.post("/", response_model=HoneypotResponse)
-@app.post("/honeypot", response_model=HoneypotResponse)
-async def post_honeypot(request: Request, x_api_key: Optional[str] = Header(None, alias="x-api-key")):
-    return await handle_honeypot_logic(request, x_api_key)
+@app.post("/", response_model=HoneypotResponse, dependencies=[Depends(verify_api_key)])
+@app.post("/honeypot", response_model=HoneypotResponse, dependencies=[Depends(verify_api_key)])
+async def post_honeypot(payload: HoneypotRequest, background_tasks: BackgroundTasks):
+    return await handle_honeypot_logic(payload, background_tasks)
+
+@app.post("/honeypot/stream", dependencies=[Depends(verify_api_key)])
+async def post_honeypot_stream(payload: HoneypotRequest):
+    """Server-sent events: one {"delta"} event per token, then the final reply"""
+    tasks = BackgroundTasks()
+    try:
+        conversation_history = [m.model_dump() for m in payload.conversationHistory]
+        session = await ingest_message(payload, conversation_history, tasks)
+    except Exception as e:
+        print(f"Logic Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    parts = []
+    
+    def reply_text() -> str:
+        return agent.clean_reply("".join(parts))
+    
+    async def events():
+        if session.scam_detected:
+            pieces = agent.stream_response(
+                session_id=session.session_id,
+                messages=session.messages,
+                scam_info=session.scam_info,
+                message_count=session.message_count
+            )
+            async for piece in pieces:
+                parts.append(piece)
+                yield b"data: " + orjson.dumps({"delta": piece}) + b"\n\n"
+        else:
+            parts.append(NEUTRAL_REPLY)
+        yield b"data: " + orjson.dumps({"status": "success", "reply": reply_text()}) + b"\n\n"
+    
+    # Runs once the stream is done, with the full reply
+    async def finish():
+        await record_reply(session, reply_text(), tasks)
+        await tasks()
+    
+    return StreamingResponse(events(), media_type="text/event-stream", background=BackgroundTask(finish))
 
 @app.get("/")
 @app.get("/honeypot")
@@ -173,12 +347,8 @@ async def get_honeypot():
 
 # --- PROBLEM 1: AI VOICE DETECTION ENDPOINT ---
 
-@app.post("/api/voice-detection", response_model=VoiceDetectionResponse)
-async def voice_detection_endpoint(
-    request: VoiceDetectionRequest,
-    x_api_key: Optional[str] = Header(None, alias="x-api-key")
-):
-    verify_api_key(x_api_key)
+@app.post("/api/voice-detection", response_model=VoiceDetectionResponse, dependencies=[Depends(verify_api_key)])
+async def voice_detection_endpoint(request: VoiceDetectionRequest):
     result = voice_detector.detect(request.language, request.audioBase64)
     if result["status"] == "error":
         raise HTTPException(status_code=400, detail=result["message"])
@@ -192,15 +362,16 @@ async def health_check():
 
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon():
-    from fastapi.responses import Response
     return Response(status_code=204)
 
 # --- STARTUP ---
 
 if __name__ == "__main__":
+    # uvloop and httptools are picked up automatically when installed
     uvicorn.run(
         "app:app",
-        host=Config.HOST,
-        port=Config.PORT,
+        host=CONFIG.HOST,
+        port=CONFIG.PORT,
+        workers=CONFIG.WORKERS,
         reload=False
     )
\ No newline at end of file
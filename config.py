@@ -1,29 +1,83 @@
 import os
+from dataclasses import dataclass
+from typing import Final, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
 
-class Config:
+@dataclass(frozen=True, slots=True)
+class _Config:
     # API Settings
-    API_KEY = os.getenv("API_KEY", "your-secret-honeypot-key-12345")
-    GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+    API_KEY: str
+    GROQ_API_KEY: Optional[str]
     
     # Server Settings
-    HOST = os.getenv("HOST", "0.0.0.0")
-    PORT = int(os.getenv("PORT", 8000))
+    HOST: str
+    PORT: int
+    
+    # Session Store (shared across workers when set)
+    REDIS_URL: Optional[str]
+    SESSION_TTL: int  # Seconds
+    MAX_SESSIONS: int  # In-memory sessions per worker
+    SESSION_SWEEP_INTERVAL: int  # Seconds between idle-session sweeps
+    
+    # Worker processes: 2*CPU+1, but only when sessions are shared via Redis
+    WORKERS: int
+    
+    # Request Limits
+    MAX_BODY_BYTES: int  # Honeypot request bodies only
+    MAX_MESSAGE_LENGTH: int  # Characters per text field
+    MAX_HISTORY_MESSAGES: int  # Older conversationHistory turns are dropped
     
     # GUVI Callback
-    GUVI_CALLBACK_URL = os.getenv(
-        "GUVI_CALLBACK_URL",
-        "https://hackathon.guvi.in/api/updateHoneyPotFinalResult"
-    )
+    GUVI_CALLBACK_URL: str
     
     # Agent Settings
-    MAX_MESSAGES = 25  # Maximum messages before ending
-    MIN_MESSAGES_FOR_INTEL = 1  # Send callback as soon as scam is confirmed
+    MAX_MESSAGES: int  # Maximum messages before ending
+    MIN_MESSAGES_FOR_INTEL: int  # Send callback as soon as scam is confirmed
     
     # Scam Detection Thresholds
-    SCAM_THRESHOLD = 0.6  # 60% confidence = scam
+    SCAM_THRESHOLD: float  # 60% confidence = scam
     
     # AI Model
-    AI_MODEL = "mixtral-8x7b-32768"  # Fast and free on Groq
\ No newline at end of file
+    AI_MODEL: str  # Fast and free on Groq
+    RESPONSE_CACHE_SIZE: int  # Cached replies for repeated scam scripts
+    MAX_CONCURRENT_COMPLETIONS: int  # In-flight Groq calls per worker
+
+_REDIS_URL = os.getenv("REDIS_URL")
+
+def _workers() -> int:
+    """2*CPU+1 worker processes, but only when sessions are shared via Redis"""
+    if not _REDIS_URL:
+        # Sessions are per process, so a second worker would see a known
+        # session as new; ignore WEB_CONCURRENCY set by the platform
+        if int(os.getenv("WEB_CONCURRENCY", 1)) > 1:
+            print("WEB_CONCURRENCY ignored: running 1 worker because REDIS_URL is not set")
+        return 1
+    return int(os.getenv("WEB_CONCURRENCY", 2 * (os.cpu_count() or 1) + 1))
+
+# Environment is read once, here; the values never change at runtime
+CONFIG: Final = _Config(
+    API_KEY=os.getenv("API_KEY", "your-secret-honeypot-key-12345"),
+    GROQ_API_KEY=os.getenv("GROQ_API_KEY"),
+    HOST=os.getenv("HOST", "0.0.0.0"),
+    PORT=int(os.getenv("PORT", 8000)),
+    REDIS_URL=_REDIS_URL,
+    SESSION_TTL=int(os.getenv("SESSION_TTL", 86400)),
+    MAX_SESSIONS=10000,
+    SESSION_SWEEP_INTERVAL=600,
+    WORKERS=_workers(),
+    MAX_BODY_BYTES=64 * 1024,
+    MAX_MESSAGE_LENGTH=4096,
+    MAX_HISTORY_MESSAGES=20,
+    GUVI_CALLBACK_URL=os.getenv(
+        "GUVI_CALLBACK_URL",
+        "https://hackathon.guvi.in/api/updateHoneyPotFinalResult"
+    ),
+    MAX_MESSAGES=25,
+    MIN_MESSAGES_FOR_INTEL=1,
+    SCAM_THRESHOLD=0.6,
+    AI_MODEL="mixtral-8x7b-32768",
+    RESPONSE_CACHE_SIZE=2048,
+    MAX_CONCURRENT_COMPLETIONS=16,
+)
\ No newline at end of file
@@ -1,74 +1,83 @@
 import re
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import keywords
+from patterns import URL_RE, UPI_RE, EMAIL_RE, PHONE_RE, IFSC_RE, BANK_ACCT_RE
+
+_UPI_PROVIDERS = ('paytm', 'phonepe', 'gpay', 'upi', 'ybl', 'okhdfcbank', 'oksbi')
+
+# Alternatives are tried in order at each position, so a URL swallows any
+# handle inside it and a phone number is not also reported as an account.
+_INTEL_RE = re.compile('|'.join(f'(?P<{name}>{pattern.pattern})' for name, pattern in (
+    ('url', URL_RE),
+    ('handle', UPI_RE),
+    ('phone', PHONE_RE),
+    ('ifsc', IFSC_RE),
+    ('account', BANK_ACCT_RE),
+)))
+
+_GROUP_KEYS = {
+    'url': 'phishingLinks',
+    'phone': 'phoneNumbers',
+    'ifsc': 'bankAccounts',
+    'account': 'bankAccounts',
+}
+
+_KEYS = (
+    'bankAccounts',
+    'upiIds',
+    'phishingLinks',
+    'phoneNumbers',
+    'suspiciousKeywords',
+    'emailAddresses',
+    'organizationNames',
+)
+
+# Sent to GUVI; all of them, even when empty
+_CALLBACK_KEYS = ('bankAccounts', 'upiIds', 'phishingLinks', 'phoneNumbers', 'suspiciousKeywords')
 
 class IntelligenceExtractor:
     """Extract and categorize scam intelligence"""
     
     def __init__(self):
-        self.intelligence = {
-            'bankAccounts': [],
-            'upiIds': [],
-            'phishingLinks': [],
-            'phoneNumbers': [],
-            'suspiciousKeywords': [],
-            'emailAddresses': [],
-            'organizationNames': [],
-        }
+        # Sets keep each key deduplicated as items arrive
+        self.intelligence: Dict[str, Set[str]] = {key: set() for key in _KEYS}
+        self.count = 0
     
-    def extract(self, message: str) -> None:
-        """Extract intelligence from a message"""
+    def extract(self, message: str, message_lower: Optional[str] = None) -> List[Tuple[str, str]]:
+        """Extract intelligence from a message; returns the (key, value) items found"""
+        if message_lower is None:
+            message_lower = message.lower()
+        found = []
         
-        # Extract bank accounts
-        bank_patterns = [
-            r'\b\d{9,18}\b',  # Account numbers
-            r'[A-Z]{4}0[A-Z0-9]{6}',  # IFSC codes
-        ]
-        for pattern in bank_patterns:
-            matches = re.findall(pattern, message)
-            self.intelligence['bankAccounts'].extend(matches)
-        
-        # Extract UPI IDs
-        upi_pattern = r'[\w\.-]+@[\w\.-]+'
-        upi_matches = re.findall(upi_pattern, message)
-        for match in upi_matches:
-            if any(provider in match.lower() for provider in ['paytm', 'phonepe', 'gpay', 'upi', 'ybl', 'okhdfcbank', 'oksbi']):
-                self.intelligence['upiIds'].append(match)
-            elif '@' in match and '.' in match:
-                self.intelligence['emailAddresses'].append(match)
-        
-        # Extract phone numbers
-        phone_pattern = r'(\+91|0)?[6-9]\d{9}'
-        phone_matches = re.findall(phone_pattern, message)
-        self.intelligence['phoneNumbers'].extend(phone_matches)
-        
-        # Extract URLs
-        url_pattern = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
-        url_matches = re.findall(url_pattern, message)
-        self.intelligence['phishingLinks'].extend(url_matches)
+        # Links, UPI IDs/emails, phone numbers and bank details in one scan
+        for match in _INTEL_RE.finditer(message):
+            kind, value = match.lastgroup, match.group()
+            if kind == 'handle':
+                if any(provider in value.lower() for provider in _UPI_PROVIDERS):
+                    found.append(('upiIds', value))
+                elif email := EMAIL_RE.match(value):
+                    # Drops trailing sentence punctuation the handle picked up
+                    found.append(('emailAddresses', email.group()))
+            else:
+                found.append((_GROUP_KEYS[kind], value))
         
         # Extract organization names (basic)
-        org_patterns = [
-            r'(SBI|HDFC|ICICI|Axis|Paytm|PhonePe|Google Pay|Amazon|Flipkart)\s*(Bank|Pay)?',
-        ]
-        for pattern in org_patterns:
-            matches = re.findall(pattern, message, re.IGNORECASE)
-            if matches:
-                self.intelligence['organizationNames'].extend([m[0] for m in matches])
+        found.extend(('organizationNames', name) for _, _, name in keywords.find(message_lower, 'org'))
         
-        # Deduplicate
-        for key in self.intelligence:
-            self.intelligence[key] = list(set(self.intelligence[key]))
+        self.add(found)
+        return found
+    
+    def add(self, items: Iterable[Tuple[str, str]]) -> None:
+        """Add (key, value) items, e.g. ones restored from the session store"""
+        for key, value in items:
+            self.intelligence[key].add(value)
+        # Kept current here so agent notes never walk the sets
+        self.count = sum(map(len, self.intelligence.values()))
     
-    def get_intelligence(self) -> Dict:
+    def get_intelligence(self) -> Dict[str, List[str]]:
         """Get all extracted intelligence in the format exactly required by the callback"""
-        return {
-            'bankAccounts': self.intelligence['bankAccounts'],
-            'upiIds': self.intelligence['upiIds'],
-            'phishingLinks': self.intelligence['phishingLinks'],
-            'phoneNumbers': self.intelligence['phoneNumbers'],
-            'suspiciousKeywords': self.intelligence['suspiciousKeywords']
-        }
+        return {key: list(self.intelligence[key]) for key in _CALLBACK_KEYS}
     
     def get_count(self) -> int:
         """Get total number of intelligence items extracted"""
-        return sum(len(v) for v in self.intelligence.values())
\ No newline at end of file
+        return self.count
\ No newline at end of file
@@ -0,0 +1,87 @@
+from typing import Dict, List, Optional, Tuple
+import ahocorasick
+
+SCAM_KEYWORDS = {
+    'urgent': 3.0,
+    'verify': 2.5,
+    'account blocked': 4.0,
+    'suspended': 3.5,
+    'immediate': 3.0,
+    'click here': 2.5,
+    'confirm': 2.0,
+    'update': 2.0,
+    'security': 2.0,
+    'otp': 3.5,
+    'upi': 2.5,
+    'bank': 2.0,
+    'payment': 2.0,
+    'transfer': 2.5,
+    'prize': 3.0,
+    'winner': 3.0,
+    'congratulations': 2.5,
+    'lottery': 4.0,
+    'refund': 2.5,
+    'cashback': 2.5,
+    'limited time': 3.0,
+    'expire': 2.5,
+    'last chance': 3.0,
+    'act now': 3.0,
+    'kycupdate': 4.0,
+    'block': 3.5,
+    'fraud': 3.0,
+    'unauthorized': 3.0,
+}
+
+# Reported to GUVI as suspiciousKeywords
+SUSPICIOUS_WORDS = ['urgent', 'verify', 'block', 'suspend', 'otp', 'upi', 'bank', 'pay', 'transfer', 'prize', 'winner']
+
+ORGANIZATION_NAMES = ['SBI', 'HDFC', 'ICICI', 'Axis', 'Paytm', 'PhonePe', 'Google Pay', 'Amazon', 'Flipkart']
+
+# Scam types in priority order, with the words that indicate each one
+SCAM_TYPE_WORDS = (
+    ("Bank Account Fraud", ('bank', 'account')),
+    ("UPI Fraud", ('upi',)),
+    ("OTP/PIN Theft", ('otp', 'pin')),
+    ("Prize/Lottery Scam", ('prize', 'winner', 'lottery')),
+    ("KYC/Verification Scam", ('kyc', 'verify')),
+)
+
+# (category, word, value) for each category a word belongs to
+Entry = Tuple[str, str, object]
+
+def _collect_entries() -> Dict[str, Tuple[Entry, ...]]:
+    entries: Dict[str, List[Entry]] = {}
+    for word, weight in SCAM_KEYWORDS.items():
+        entries.setdefault(word, []).append(('scam', word, weight))
+    for word in SUSPICIOUS_WORDS:
+        entries.setdefault(word, []).append(('suspicious', word, None))
+    for name in ORGANIZATION_NAMES:
+        entries.setdefault(name.lower(), []).append(('org', name.lower(), name))
+    for rank, (scam_type, words) in enumerate(SCAM_TYPE_WORDS):
+        for word in words:
+            entries.setdefault(word, []).append(('type', word, (rank, scam_type)))
+    return {word: tuple(payload) for word, payload in entries.items()}
+
+def _build_automaton(entries: Dict[str, Tuple[Entry, ...]]) -> ahocorasick.Automaton:
+    automaton = ahocorasick.Automaton()
+    for word, payload in entries.items():
+        automaton.add_word(word, payload)
+    automaton.make_automaton()
+    return automaton
+
+SHARED_AC = _build_automaton(_collect_entries())
+
+def find(text_lower: str, category: Optional[str] = None) -> List[Entry]:
+    """
+    Scan lowercased text once for every known keyword
+    Returns unique (category, word, value) entries in order of first appearance,
+    optionally only those of one category.
+    """
+    seen = set()
+    hits = []
+    for _, payload in SHARED_AC.iter(text_lower):
+        for entry in payload:
+            if entry[:2] not in seen and (category is None or entry[0] == category):
+                seen.add(entry[:2])
+                hits.append(entry)
+    return hits
\ No newline at end of file
@@ -0,0 +1,14 @@
+import re
+
+# Compiled once and shared by the detector, the extractor and the agent
+
+URL_RE = re.compile(r'https?://[^\s<>"\']+')
+PHONE_RE = re.compile(r'(?<!\d)(?:\+91|0)?[6-9]\d{9}(?!\d)')
+EMAIL_RE = re.compile(r'[\w\.-]+@[\w-]+(?:\.[\w-]+)*\.[a-zA-Z]{2,}')
+UPI_RE = re.compile(r'[\w\.-]+@[\w\.-]+')  # Also matches emails; see EMAIL_RE
+BANK_ACCT_RE = re.compile(r'\b\d{9,18}\b')
+IFSC_RE = re.compile(r'[A-Z]{4}0[A-Z0-9]{6}')
+
+# Searched on lowercased text
+MONEY_PATTERNS = [r'₹\s?\d+', r'rs\.?\s?\d+', r'pay\s+\d+', r'\d+\s*rupees']
+MONEY_RE = re.compile('|'.join(f'(?:{p})' for p in MONEY_PATTERNS))
\ No newline at end of file
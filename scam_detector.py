@@ -1,39 +1,31 @@
 import re
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
+import keywords
+from patterns import URL_RE, PHONE_RE, MONEY_PATTERNS, MONEY_RE
+
+# Risk factors are kept as (tag, argument) and only turned into text when
+# something shows them, via render_risk_factors
+RF_KEYWORD, RF_URGENCY, RF_SENSITIVE, RF_URL, RF_PHONE, RF_MONEY = range(6)
+
+RiskFactor = Tuple[int, object]
+
+_RF_STRINGS = {
+    RF_KEYWORD: "Scam keyword: '{}'",
+    RF_URGENCY: "Urgency tactic detected",
+    RF_SENSITIVE: "Requesting sensitive information",
+    RF_URL: "Contains suspicious link",
+    RF_PHONE: "Contains phone number",
+    RF_MONEY: "Money request detected",
+}
+
+def render_risk_factors(risk_factors: List[RiskFactor]) -> List[str]:
+    """Human-readable text for each risk factor"""
+    return [_RF_STRINGS[tag].format(arg) for tag, arg in risk_factors]
 
 class ScamDetector:
     """Advanced multi-layer scam detection engine"""
     
-    SCAM_KEYWORDS = {
-        'urgent': 3.0,
-        'verify': 2.5,
-        'account blocked': 4.0,
-        'suspended': 3.5,
-        'immediate': 3.0,
-        'click here': 2.5,
-        'confirm': 2.0,
-        'update': 2.0,
-        'security': 2.0,
-        'otp': 3.5,
-        'upi': 2.5,
-        'bank': 2.0,
-        'payment': 2.0,
-        'transfer': 2.5,
-        'prize': 3.0,
-        'winner': 3.0,
-        'congratulations': 2.5,
-        'lottery': 4.0,
-        'refund': 2.5,
-        'cashback': 2.5,
-        'limited time': 3.0,
-        'expire': 2.5,
-        'last chance': 3.0,
-        'act now': 3.0,
-        'kycupdate': 4.0,
-        'block': 3.5,
-        'fraud': 3.0,
-        'unauthorized': 3.0,
-    }
+    SCAM_KEYWORDS = keywords.SCAM_KEYWORDS
     
     URGENCY_PATTERNS = [
         r'within \d+ (hours?|minutes?|days?)',
@@ -55,87 +47,72 @@ class ScamDetector:
         r'(verify|confirm|update).*(detail|information)',
     ]
     
-    def detect(self, message: str, conversation_history: List[Dict]) -> Dict:
+    MONEY_PATTERNS = MONEY_PATTERNS
+    
+    # Each pattern list compiled once into a single alternation; any match
+    # scores the category, same as the first-hit-and-break loops did
+    _URGENCY_RE = re.compile('|'.join(f'(?:{p})' for p in URGENCY_PATTERNS))
+    _SENSITIVE_RE = re.compile('|'.join(f'(?:{p})' for p in SENSITIVE_DATA_REQUESTS))
+    
+    # (pattern, search lowercased text?, weight, risk factor), in report order
+    _SIGNALS = (
+        (_URGENCY_RE, True, 2.0, (RF_URGENCY, None)),
+        (_SENSITIVE_RE, True, 3.0, (RF_SENSITIVE, None)),
+        (URL_RE, False, 2.5, (RF_URL, None)),
+        (PHONE_RE, False, 1.5, (RF_PHONE, None)),
+        (MONEY_RE, True, 3.0, (RF_MONEY, None)),
+    )
+    
+    def __init__(self, threshold: float = 0.6):
+        self.threshold = threshold
+    
+    def detect(self, message: str, conversation_history: List[Dict], message_lower: Optional[str] = None) -> Dict:
         """
         Multi-layer scam detection
         Returns: {
             'is_scam': bool,
             'confidence': float,
             'scam_type': str,
-            'risk_factors': List[str]
+            'risk_factors': List[RiskFactor]
         }
+        Pass message_lower when the caller already has it.
         """
-        message_lower = message.lower()
+        if message_lower is None:
+            message_lower = message.lower()
         score = 0.0
-        risk_factors = []
-        
-        # 1. Keyword Analysis
-        for keyword, weight in self.SCAM_KEYWORDS.items():
-            if keyword in message_lower:
-                score += weight
-                risk_factors.append(f"Scam keyword: '{keyword}'")
-        
-        # 2. Urgency Detection
-        for pattern in self.URGENCY_PATTERNS:
-            if re.search(pattern, message_lower):
-                score += 2.0
-                risk_factors.append("Urgency tactic detected")
-                break
-        
-        # 3. Sensitive Data Request
-        for pattern in self.SENSITIVE_DATA_REQUESTS:
-            if re.search(pattern, message_lower):
-                score += 3.0
-                risk_factors.append("Requesting sensitive information")
-                break
+        risk_factors: List[RiskFactor] = []
         
-        # 4. URL/Link Detection
-        url_pattern = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
-        if re.search(url_pattern, message):
-            score += 2.5
-            risk_factors.append("Contains suspicious link")
+        # 1. Keyword Analysis (one pass; each keyword counts once). The same
+        # pass finds the highest-priority scam type word.
+        type_hit = None
+        for category, keyword, value in keywords.find(message_lower):
+            if category == 'scam':
+                score += value
+                risk_factors.append((RF_KEYWORD, keyword))
+            elif category == 'type' and (type_hit is None or value < type_hit):
+                type_hit = value
         
-        # 5. Phone Number Detection
-        phone_pattern = r'(\+91|0)?[6-9]\d{9}'
-        if re.search(phone_pattern, message):
-            score += 1.5
-            risk_factors.append("Contains phone number")
-        
-        # 6. Money Request
-        money_patterns = [r'₹\s?\d+', r'rs\.?\s?\d+', r'pay\s+\d+', r'\d+\s*rupees']
-        for pattern in money_patterns:
-            if re.search(pattern, message_lower):
-                score += 3.0
-                risk_factors.append("Money request detected")
-                break
+        # 2-6. Urgency, sensitive data request, link, phone number, money request
+        for pattern, lowered, weight, factor in self._SIGNALS:
+            if pattern.search(message_lower if lowered else message):
+                score += weight
+                risk_factors.append(factor)
         
         # Normalize score to 0-1 confidence
         confidence = min(score / 15.0, 1.0)
         
         # Determine scam type
-        scam_type = self._classify_scam_type(message_lower, risk_factors)
+        if type_hit is not None:
+            scam_type = type_hit[1]
+        elif (RF_URL, None) in risk_factors:
+            scam_type = "Phishing"
+        else:
+            scam_type = "Generic Fraud"
         
         return {
-            'is_scam': confidence >= 0.6,
+            'is_scam': confidence >= self.threshold,
             'confidence': round(confidence, 2),
             'scam_type': scam_type,
             'risk_factors': risk_factors,
             'risk_score': round(score, 2)
-        }
-    
-    def _classify_scam_type(self, message: str, risk_factors: List[str]) -> str:
-        """Classify the type of scam"""
-        if 'bank' in message or 'account' in message:
-            return "Bank Account Fraud"
-        elif 'upi' in message:
-            return "UPI Fraud"
-        elif 'otp' in message or 'pin' in message:
-            return "OTP/PIN Theft"
-        elif 'prize' in message or 'winner' in message or 'lottery' in message:
-            return "Prize/Lottery Scam"
-        elif 'kyc' in message or 'verify' in message:
-            return "KYC/Verification Scam"
-        elif any('link' in rf.lower() for rf in risk_factors):
-            return "Phishing"
-        else:
-            return "Generic Fraud"
\ No newline at end of file
+        }
\ No newline at end of file
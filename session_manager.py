@@ -1,123 +1,438 @@
-from typing import Dict, List, Optional
-from datetime import datetime
-import requests
+from typing import Any, Dict, List, Optional, Set, Tuple
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass, field
+import asyncio
+import time
+import httpx
+import orjson
+import xxhash
+import redis.asyncio as redis
+import keywords
 from intelligence import IntelligenceExtractor
+from scam_detector import render_risk_factors
+
+@dataclass(slots=True)
+class Session:
+    """State of one honeypot conversation"""
+    session_id: str
+    started_at: float  # Epoch seconds
+    message_count: int = 0
+    scam_detected: bool = False
+    scam_info: Dict = field(default_factory=dict)
+    intelligence: IntelligenceExtractor = field(default_factory=IntelligenceExtractor)
+    conversation: List[Dict] = field(default_factory=list)
+    messages: List[Dict] = field(default_factory=list)  # Chat-format history sent to the LLM, append-only
+    agent_persona: Optional[str] = None
+    callback_sent: bool = False
+    # Suspicious keywords seen in scammer messages, in order of first appearance
+    keyword_hits: Counter[str] = field(default_factory=Counter)
+    last_active: float = field(default_factory=time.time)
+    # Last three conversation entries, for the repetition check
+    recent: deque = field(default_factory=lambda: deque(maxlen=3))
+    # Raw chat messages ever added, seeded ones included, and how many of
+    # them the summary heading `messages` stands for once compacted
+    history_length: int = 0
+    compacted: int = 0
+    
+    def should_end(self, max_messages: int = 25) -> bool:
+        """Determine if conversation should end"""
+        # End if max messages reached
+        if self.message_count >= max_messages:
+            return True
+        
+        # End if scammer seems to give up (check last messages)
+        if self.message_count > 10:
+            scammer_messages = [m for m in self.recent if m['sender'] == 'scammer']
+            
+            # If scammer is repeating or getting frustrated. Hashes differ
+            # for almost every pair; text is only compared when they match.
+            if len(scammer_messages) >= 2:
+                last, previous = scammer_messages[-1], scammer_messages[-2]
+                if last['hash'] == previous['hash'] and last['text'] == previous['text']:
+                    return True
+        
+        return False
+
+# Callbacks posted at once, and retries before giving up
+CALLBACK_CONCURRENCY = 16
+CALLBACK_MAX_ATTEMPTS = 3
+
+# Seconds a worker's claim on a session's callback holds. Longer than all
+# attempts with their timeouts and backoff, so only a dead worker's expires.
+CALLBACK_LOCK_TTL = 60
+
+# Seconds between "session cap exceeded" warnings
+CAP_WARNING_INTERVAL = 60
+
+# Redis keys per session, after "session:{id}": a hash of scalar fields,
+# conversation and chat-message lists, an intel set and a keyword zset.
+# Every write is an append, add, increment or set-if-absent, so turns of one
+# session on different workers never overwrite each other.
+_KEY_SUFFIXES = ('', ':conversation', ':messages', ':intel', ':keywords')
+
+# (command, key suffix, args, kwargs) of one staged Redis write
+PendingOp = Tuple[str, str, tuple, Dict[str, Any]]
 
 class SessionManager:
     """Manage conversation sessions and intelligence"""
     
-    def __init__(self, guvi_callback_url: str):
-        self.sessions: Dict[str, Dict] = {}
+    def __init__(
+        self,
+        guvi_callback_url: str,
+        redis_url: Optional[str] = None,
+        session_ttl: int = 86400,
+        max_sessions: int = 10000,
+        max_messages: int = 25
+    ):
+        # Least recently used first
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        # Ids of sessions that are over and reported, in the order they finished
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+        self._cap_warned_at = 0.0
         self.guvi_callback_url = guvi_callback_url
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        # Without Redis, sessions only live in this process (single worker)
+        self._redis = redis.Redis.from_url(redis_url) if redis_url else None
+        # Writes staged per session id until save_session sends them
+        self._pending: Dict[str, List[PendingOp]] = {}
+        # Callbacks multiplex over one HTTP/2 connection to GUVI, posted by
+        # run_callback_worker so no request ever waits on them
+        self._http = httpx.AsyncClient(
+            http2=True,
+            timeout=5.0,
+            limits=httpx.Limits(max_connections=32)
+        )
+        self._callback_headers = {'Content-Type': 'application/json'}
+        self._callbacks: "asyncio.Queue[Tuple[str, bytes, int]]" = asyncio.Queue()
+        self._post_slots = asyncio.Semaphore(CALLBACK_CONCURRENCY)
+        self._posts: Set[asyncio.Task] = set()
+        # Ids with a callback queued or being retried by this process; other
+        # workers are kept off them by the expiring callback lock in Redis
+        self._queued: Set[str] = set()
     
-    def get_or_create_session(self, session_id: str) -> Dict:
+    async def load_session(self, session_id: str) -> Session:
+        """Get session, refreshed from Redis when it is configured"""
+        if self._redis is not None:
+            # Send our own staged writes first so the read includes them
+            await self.save_session(session_id)
+            key = f"session:{session_id}"
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.hgetall(key)
+                pipe.lrange(key + ':conversation', 0, -1)
+                pipe.lrange(key + ':messages', 0, -1)
+                pipe.smembers(key + ':intel')
+                pipe.zrange(key + ':keywords', 0, -1)
+                fields, conversation, messages, intel, words = await pipe.execute()
+            if fields:
+                self._restore(session_id, fields, conversation, messages, intel, words)
+        return self.get_or_create_session(session_id)
+    
+    def _restore(self, session_id: str, fields: Dict, conversation: List, messages: List, intel: set, words: List) -> None:
+        """Rebuild the local session from its Redis keys"""
+        fresh = Session(session_id, float(fields.get(b'started_at', time.time())))
+        fresh.message_count = int(fields.get(b'message_count', 0))
+        if b'scam_info' in fields:
+            fresh.scam_detected = True
+            fresh.scam_info = orjson.loads(fields[b'scam_info'])
+        fresh.callback_sent = b'callback_sent' in fields
+        fresh.conversation = [orjson.loads(record) for record in conversation]
+        fresh.recent.extend(fresh.conversation[-3:])
+        
+        raw = [orjson.loads(message) for message in messages]
+        fresh.history_length = len(raw)
+        fresh.compacted = int(fields.get(b'compacted', 0))
+        summary = fields.get(b'summary')
+        head = [{"role": "system", "content": summary.decode()}] if summary else []
+        fresh.messages = head + raw[fresh.compacted:]
+        
+        fresh.intelligence.add(item.decode().split(':', 1) for item in intel)
+        fresh.keyword_hits.update(word.decode() for word in words)
+        
+        session = self.sessions.get(session_id)
+        if session is None:
+            self.sessions[session_id] = session = fresh
+            self._evict()
+        else:
+            # Refreshed in place, so requests already holding it see this too
+            for name in Session.__slots__:
+                setattr(session, name, getattr(fresh, name))
+        self._track_finished(session)
+    
+    def _record(self, session_id: str, command: str, suffix: str, *args, **kwargs) -> None:
+        """Stage one Redis write for the session; no-op without Redis"""
+        if self._redis is not None:
+            self._pending.setdefault(session_id, []).append((command, suffix, args, kwargs))
+    
+    def _stage_compaction(self, session: Session) -> None:
+        """Stage the agent's history summary if it compacted since the last save"""
+        messages = session.messages
+        if not messages or messages[0]['role'] != 'system':
+            return
+        compacted = session.history_length - (len(messages) - 1)
+        if compacted != session.compacted:
+            session.compacted = compacted
+            self._record(
+                session.session_id, 'hset', '',
+                mapping={'summary': messages[0]['content'], 'compacted': compacted}
+            )
+    
+    async def save_session(self, session_id: str) -> None:
+        """Send the session's staged writes to Redis in one MULTI/EXEC"""
+        if self._redis is None:
+            return
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self._stage_compaction(session)
+        ops = self._pending.pop(session_id, None)
+        if not ops:
+            return
+        
+        key = f"session:{session_id}"
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for command, suffix, args, kwargs in ops:
+                getattr(pipe, command)(key + suffix, *args, **kwargs)
+            for suffix in _KEY_SUFFIXES:
+                pipe.expire(key + suffix, self.session_ttl)
+            await pipe.execute()
+    
+    async def close(self) -> None:
+        """Release the Redis and callback connection pools"""
+        for task in self._posts:
+            task.cancel()
+        if self._redis is not None:
+            await self._redis.aclose()
+        await self._http.aclose()
+    
+    def get_or_create_session(self, session_id: str) -> Session:
         """Get existing session or create new one"""
-        if session_id not in self.sessions:
-            self.sessions[session_id] = {
-                'session_id': session_id,
-                'started_at': datetime.utcnow().isoformat(),
-                'message_count': 0,
-                'scam_detected': False,
-                'scam_info': {},
-                'intelligence': IntelligenceExtractor(),
-                'conversation': [],
-                'agent_persona': None,
-                'callback_sent': False,
-            }
-        return self.sessions[session_id]
-    
-    def add_message(self, session_id: str, sender: str, text: str, timestamp: str):
-        """Add message to session"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = Session(session_id, time.time())
+            self._record(session_id, 'hsetnx', '', 'started_at', session.started_at)
+            self._evict()
+        else:
+            self.sessions.move_to_end(session_id)
+            session.last_active = time.time()
+        return session
+    
+    def _track_finished(self, session: Session) -> None:
+        """Note the session as evictable once it is over and reported"""
+        if session.callback_sent and session.should_end(self.max_messages):
+            self._finished[session.session_id] = None
+    
+    def _evict(self) -> None:
+        """Drop sessions once over the cap, finished ones first"""
+        while len(self.sessions) > self.max_sessions:
+            if self._finished:
+                session_id, _ = self._finished.popitem(last=False)
+                self.sessions.pop(session_id, None)
+            elif self._redis is not None:
+                # Still in Redis, so the least recently used one can be reloaded
+                del self.sessions[next(iter(self.sessions))]
+            else:
+                now = time.time()
+                if now - self._cap_warned_at >= CAP_WARNING_INTERVAL:
+                    self._cap_warned_at = now
+                    print(f"Session cap exceeded: {len(self.sessions)} sessions, none finished to evict")
+                return
+    
+    def sweep(self, max_idle: float) -> int:
+        """Drop sessions idle for longer than max_idle seconds"""
+        cutoff = time.time() - max_idle
+        dropped = 0
+        # LRU order, so the idle ones are all at the front
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if session.last_active > cutoff:
+                break
+            del self.sessions[session_id]
+            self._finished.pop(session_id, None)
+            dropped += 1
+        return dropped
+    
+    async def run_sweeper(self, interval: float) -> None:
+        """Sweep sessions that outlived the session TTL, forever"""
+        while True:
+            await asyncio.sleep(interval)
+            self.sweep(self.session_ttl)
+    
+    def add_message(self, session_id: str, sender: str, text: str, timestamp: int) -> Dict:
+        """Add message to session and return its record"""
         session = self.get_or_create_session(session_id)
-        session['conversation'].append({
+        record = {
             'sender': sender,
             'text': text,
+            'text_lower': text.lower(),  # Lowered once for every keyword scan
             'timestamp': timestamp
-        })
-        session['message_count'] += 1
+        }
+        if sender == 'scammer':
+            record['hash'] = xxhash.xxh3_64_intdigest(text.encode())
+            words = [word for _, word, _ in keywords.find(record['text_lower'], 'suspicious')]
+            if words:
+                session.keyword_hits.update(words)
+                # Scored by arrival, so the zset keeps first-appearance order
+                self._record(
+                    session_id, 'zadd', ':keywords',
+                    {word: session.message_count + i / 100 for i, word in enumerate(words)}, nx=True
+                )
+        message = {
+            'role': 'user' if sender == 'scammer' else 'assistant',
+            'content': text
+        }
+        session.conversation.append(record)
+        session.recent.append(record)
+        session.messages.append(message)
+        session.history_length += 1
+        session.message_count += 1
+        self._record(session_id, 'rpush', ':conversation', orjson.dumps(record))
+        self._record(session_id, 'rpush', ':messages', orjson.dumps(message))
+        self._record(session_id, 'hincrby', '', 'message_count', 1)
+        self._track_finished(session)
+        return record
+    
+    def mark_scam(self, session_id: str, detection_result: Dict) -> None:
+        """Flag the session as a confirmed scam; the first stored detection wins"""
+        session = self.get_or_create_session(session_id)
+        session.scam_detected = True
+        session.scam_info = detection_result
+        self._record(session_id, 'hsetnx', '', 'scam_info', orjson.dumps(detection_result))
+    
+    async def extract(self, session_id: str, message: str, message_lower: str) -> None:
+        """Extract intelligence into the session's current record"""
+        # Looked up by id, not bound to the request's object: a later turn
+        # may have reloaded the session from Redis in the meantime. Being
+        # async, it also runs on the event loop, never beside a save.
+        session = self.sessions.get(session_id)
+        if session is None:
+            return
+        found = session.intelligence.extract(message, message_lower)
+        if found:
+            self._record(session_id, 'sadd', ':intel', *{f"{key}:{value}" for key, value in found})
+    
+    def seed_history(self, session_id: str, history: List[Dict]):
+        """Give a fresh session the client's prior turns as LLM context"""
+        session = self.get_or_create_session(session_id)
+        if session.messages or not history:
+            return
+        seeded = [
+            {'role': 'user' if m['sender'] == 'scammer' else 'assistant', 'content': m['text']}
+            for m in history
+        ]
+        session.messages.extend(seeded)
+        session.history_length += len(seeded)
+        self._record(session_id, 'rpush', ':messages', *map(orjson.dumps, seeded))
     
     def should_end_conversation(self, session_id: str, max_messages: int = 25) -> bool:
         """Determine if conversation should end"""
         session = self.sessions.get(session_id)
         if not session:
             return False
-        
-        # End if max messages reached
-        if session['message_count'] >= max_messages:
-            return True
-        
-        # End if scammer seems to give up (check last messages)
-        if session['message_count'] > 10:
-            last_messages = session['conversation'][-3:]
-            scammer_messages = [m['text'] for m in last_messages if m['sender'] == 'scammer']
-            
-            # If scammer is repeating or getting frustrated
-            if len(scammer_messages) >= 2:
-                if scammer_messages[-1] == scammer_messages[-2]:
-                    return True
-        
-        return False
+        return session.should_end(max_messages)
     
-    def send_final_callback(self, session_id: str, min_messages: int = 5) -> bool:
-        """Send final intelligence to GUVI"""
+    async def send_final_callback(self, session_id: str, min_messages: int = 5) -> bool:
+        """Queue final intelligence for GUVI; run_callback_worker posts it"""
         session = self.sessions.get(session_id)
-        if not session or session['callback_sent']:
+        if not session or session.callback_sent or session_id in self._queued:
             return False
         
         # Don't send if too few messages
-        if session['message_count'] < min_messages:
+        if session.message_count < min_messages:
+            return False
+        
+        # Claim it across workers; the next turn may land on another one
+        # while this post is still in flight
+        if self._redis is not None and not await self._redis.set(
+                f"session:{session_id}:callback_lock", 1, nx=True, ex=CALLBACK_LOCK_TTL):
             return False
         
-        intelligence_data = session['intelligence'].get_intelligence()
+        intelligence_data = session.intelligence.get_intelligence()
         
-        # Add suspicious keywords from conversation
-        all_messages = ' '.join([m['text'] for m in session['conversation'] if m['sender'] == 'scammer'])
-        keywords = self._extract_keywords(all_messages)
-        if keywords:
-            intelligence_data['suspiciousKeywords'] = keywords
+        # Add suspicious keywords counted as the scammer's messages arrived
+        suspicious = list(session.keyword_hits)[:10]  # Max 10 keywords
+        if suspicious:
+            intelligence_data['suspiciousKeywords'] = suspicious
         
         payload = {
             "sessionId": session_id,
-            "scamDetected": session['scam_detected'],
-            "totalMessagesExchanged": session['message_count'],
+            "scamDetected": session.scam_detected,
+            "totalMessagesExchanged": session.message_count,
             "extractedIntelligence": intelligence_data,
             "agentNotes": self._generate_agent_notes(session)
         }
         
+        self._queued.add(session_id)
+        # Serialized once here; retries resend the same bytes
+        self._callbacks.put_nowait((session_id, orjson.dumps(payload), 1))
+        return True
+    
+    async def run_callback_worker(self) -> None:
+        """Post queued callbacks, up to CALLBACK_CONCURRENCY at a time, forever"""
+        while True:
+            item = await self._callbacks.get()
+            # Waits for any one post to finish, never for a whole batch
+            await self._post_slots.acquire()
+            task = asyncio.create_task(self._post_callback(*item))
+            self._posts.add(task)
+            task.add_done_callback(self._post_finished)
+    
+    async def _release_callback_lock(self, session_id: str) -> None:
+        if self._redis is None:
+            return
+        try:
+            await self._redis.delete(f"session:{session_id}:callback_lock")
+        except Exception as e:
+            print(f"Failed to release callback lock for {session_id}: {e}")
+    
+    def _post_finished(self, task: asyncio.Task) -> None:
+        self._posts.discard(task)
+        self._post_slots.release()
+    
+    async def _post_callback(self, session_id: str, body: bytes, attempt: int) -> None:
+        """Post one callback; failures are logged, never raised"""
         try:
-            response = requests.post(
+            response = await self._http.post(
                 self.guvi_callback_url,
-                json=payload,
-                timeout=5
+                content=body,
+                headers=self._callback_headers
             )
-            session['callback_sent'] = True
-            return response.status_code == 200
+            response.raise_for_status()
         except Exception as e:
-            print(f"Failed to send callback: {e}")
-            return False
-    
-    def _extract_keywords(self, text: str) -> List[str]:
-        """Extract suspicious keywords"""
-        keywords = []
-        suspicious_words = ['urgent', 'verify', 'block', 'suspend', 'otp', 'upi', 'bank', 'pay', 'transfer', 'prize', 'winner']
-        text_lower = text.lower()
-        
-        for word in suspicious_words:
-            if word in text_lower:
-                keywords.append(word)
+            print(f"Failed to send callback (attempt {attempt}): {e}")
+            if attempt < CALLBACK_MAX_ATTEMPTS:
+                # Back off 0.5s, 1s, ... then go round the queue again
+                delay = 0.5 * 2 ** (attempt - 1)
+                asyncio.get_running_loop().call_later(
+                    delay, self._callbacks.put_nowait, (session_id, body, attempt + 1)
+                )
+            else:
+                # Let a later turn, on any worker, queue it afresh
+                self._queued.discard(session_id)
+                await self._release_callback_lock(session_id)
+            return
         
-        return list(set(keywords))[:10]  # Max 10 keywords
+        self._queued.discard(session_id)
+        try:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                session.callback_sent = True
+                self._track_finished(session)
+            self._record(session_id, 'hset', '', 'callback_sent', 1)
+            await self.save_session(session_id)
+        except Exception as e:
+            print(f"Callback sent but not recorded for {session_id}: {e}")
     
-    def _generate_agent_notes(self, session: Dict) -> str:
+    def _generate_agent_notes(self, session: Session) -> str:
         """Generate summary notes"""
-        scam_type = session['scam_info'].get('scam_type', 'Unknown')
-        risk_factors = session['scam_info'].get('risk_factors', [])
-        intel_count = session['intelligence'].get_count()
+        scam_type = session.scam_info.get('scam_type', 'Unknown')
+        risk_factors = session.scam_info.get('risk_factors', [])
+        intel_count = session.intelligence.get_count()
         
         notes = f"Scam Type: {scam_type}. "
         notes += f"Extracted {intel_count} intelligence items. "
         
         if risk_factors:
-            notes += f"Key tactics: {', '.join(risk_factors[:3])}."
+            notes += f"Key tactics: {', '.join(render_risk_factors(risk_factors[:3]))}."
         
         return notes
\ No newline at end of file
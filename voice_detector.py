@@ -1,49 +1,58 @@
 import random
-import base64
-from typing import Dict
+from typing import Dict, List
 
 class VoiceDetector:
     """Detection engine for AI-generated vs Human voices"""
     
     SUPPORTED_LANGUAGES = ["Tamil", "English", "Hindi", "Malayalam", "Telugu"]
     
+    EXPLANATIONS = {
+        "AI_GENERATED": (
+            "Unnatural pitch consistency and robotic speech patterns detected.",
+            "Spectral anomalies found in high-frequency ranges typical of synthetic generation.",
+            "Lack of emotional breathiness and micro-variations in rhythm.",
+            "Recursive neural network artifacts detected in phoneme transitions."
+        ),
+        "HUMAN": (
+            "Natural vocal fry and emotional micro-tremors detected.",
+            "Realistic ambient noise floor and organic breathing patterns present.",
+            "Complex spectral variation consistent with biological vocal tract.",
+            "Non-repetitive pitch modulation and natural cadence observed."
+        )
+    }
+    
+    def __init__(self):
+        # Own generator, so calls don't share the module-level random state
+        self._rng = random.Random()
+    
     def detect(self, language: str, audio_base64: str) -> Dict:
         """
         Analyze voice sample (Mock implementation for hackathon)
         In a real scenario, this would use a deep learning model.
         """
+        return self.detect_batch(language, [audio_base64])[0]
+    
+    def detect_batch(self, language: str, audios_base64: List[str]) -> List[Dict]:
+        """Analyze several voice samples of one language"""
         if language not in self.SUPPORTED_LANGUAGES:
-            return {
+            error = {
                 "status": "error",
                 "message": f"Unsupported language: {language}"
             }
-            
+            return [dict(error) for _ in audios_base64]
+        
         # Mock detection logic based on base64 characteristics
         # In practice, we'd decode and run through a trained model
-        score = random.uniform(0.7, 0.98)
-        is_ai = random.choice([True, False])
-        
-        classification = "AI_GENERATED" if is_ai else "HUMAN"
-        
-        explanations = {
-            "AI_GENERATED": [
-                "Unnatural pitch consistency and robotic speech patterns detected.",
-                "Spectral anomalies found in high-frequency ranges typical of synthetic generation.",
-                "Lack of emotional breathiness and micro-variations in rhythm.",
-                "Recursive neural network artifacts detected in phoneme transitions."
-            ],
-            "HUMAN": [
-                "Natural vocal fry and emotional micro-tremors detected.",
-                "Realistic ambient noise floor and organic breathing patterns present.",
-                "Complex spectral variation consistent with biological vocal tract.",
-                "Non-repetitive pitch modulation and natural cadence observed."
-            ]
-        }
-        
-        return {
-            "status": "success",
-            "language": language,
-            "classification": classification,
-            "confidenceScore": round(score, 2),
-            "explanation": random.choice(explanations[classification])
-        }
+        uniform, choice = self._rng.uniform, self._rng.choice
+        results = []
+        for _ in audios_base64:
+            score = uniform(0.7, 0.98)
+            classification = choice(("AI_GENERATED", "HUMAN"))
+            results.append({
+                "status": "success",
+                "language": language,
+                "classification": classification,
+                "confidenceScore": round(score, 2),
+                "explanation": choice(self.EXPLANATIONS[classification])
+            })
+        return results